@@ -1,38 +1,117 @@
 # Phase 2 - The Middleware Service (with Output Formatting)
 
 import asyncio
-import json
+import orjson
 import uuid
 import websockets
 import httpx
+import aiofiles
 import random
 import os
 import base64
+import logging
+import logging.handlers
+import queue
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import NamedTuple
 
 from fastapi import FastAPI, Request, HTTPException, Depends, WebSocket, WebSocketDisconnect
-from sqlalchemy import create_engine, Column, String, Text, DateTime
+from sqlalchemy import create_engine, event, update, Column, String, Text, DateTime
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
-from sqlalchemy.sql import func
 import uvicorn
 
 # --- Configuration ---
 DB_FILE = "gatekeeper_db.sqlite"
 COMFYUI_ADDRESS = "127.0.0.1:8188"
 GATEKEEPER_PORT = 8189
-CLIENT_ID = str(uuid.uuid4())
+# ComfyUI's aiohttp server only speaks HTTP/1.1 and httpx negotiates HTTP/2 only over TLS,
+# so multi-file fetches rely on a keep-alive pool wide enough for the format_output fan-out
+COMFYUI_MAX_KEEPALIVE_CONNECTIONS = 32
+COMFYUI_MAX_CONNECTIONS = 64
+COMFYUI_KEEPALIVE_EXPIRY_SECONDS = 60.0
+CLIENT_ID_FILE = "gatekeeper_client_id"
+
+def load_client_id() -> str:
+    """Returns the persisted ComfyUI client_id, creating it on first run.
+
+    ComfyUI routes a prompt's events to the client_id it was submitted with, so the id
+    has to survive restarts for jobs that are still running in ComfyUI to report back.
+    """
+    try:
+        client_id = Path(CLIENT_ID_FILE).read_text().strip()
+        if client_id:
+            return client_id
+    except FileNotFoundError:
+        pass
+    client_id = str(uuid.uuid4())
+    Path(CLIENT_ID_FILE).write_text(client_id)
+    return client_id
+
+CLIENT_ID = load_client_id()
 JOB_HISTORY_DAYS = 30
 COMPLETED_JOB_HISTORY_DAYS = 7
+# Queued jobs older than this are not picked up again at startup; they are marked failed instead
+PENDING_JOB_RELOAD_HOURS = 24
+MAX_WS_CONNECTIONS = 10000
+WS_SWEEP_INTERVAL_SECONDS = 30
+WS_MAX_AGE_SECONDS = 3600
+COMPLETION_FLUSH_INTERVAL_SECONDS = 0.1
+COMPLETION_FLUSH_BATCH_SIZE = 50
+OUTPUT_DIR = Path(__file__).parent.absolute() / "ComfyUI" / "output"
+LOG_LEVEL = os.environ.get("GATEKEEPER_LOG_LEVEL", "INFO").upper()
+MIME_BY_EXT = {
+    "png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "gif": "image/gif", "webp": "image/webp",
+    "mp4": "video/mp4", "avi": "video/avi", "mov": "video/mov", "webm": "video/webm",
+    "mp3": "audio/mp3", "wav": "audio/wav", "ogg": "audio/ogg", "flac": "audio/flac",
+}
+
+# --- Logging Setup ---
+# Records are handed to a queue and written by a QueueListener thread, so the event loop never blocks on stdout
+log_queue = queue.SimpleQueue()
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("[%(levelname)s] %(message)s"))
+log_listener = logging.handlers.QueueListener(log_queue, log_handler)
+logger = logging.getLogger("gatekeeper")
+logger.setLevel(LOG_LEVEL)
+logger.addHandler(logging.handlers.QueueHandler(log_queue))
+logger.propagate = False
 
 # --- State Tracking ---
-last_queue_remaining = None
-last_prompt_id = None
+class PendingJob(NamedTuple):
+    job_id: str
+    callback_type: str
+    callback_url: str | None
+    output_format: str
+
+# Submitted jobs awaiting completion, keyed by ComfyUI prompt_id, so the WS hot path never reads SQLite
+pending_jobs: dict[str, PendingJob] = {}
+# Prompts whose /prompt request is still in flight; ComfyUI may not list them in /queue yet
+submitting_prompts: set[str] = set()
+# Node outputs reported by `executed` messages, collected per prompt until it finishes
+executed_outputs: dict[str, dict] = {}
+# Prompts that were pending while no ComfyUI connection was up, so some `executed` messages may
+# have been missed; these are completed from /history instead of executed_outputs
+history_prompts: set[str] = set()
+# (job_id, result_data) pairs waiting to be written to SQLite by the completion flusher
+completion_queue: asyncio.Queue = asyncio.Queue()
 
 # --- Database Setup (SQLAlchemy) ---
 Base = declarative_base()
 engine = create_engine(f"sqlite:///{DB_FILE}", connect_args={"check_same_thread": False})
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the writer and turns each commit into a log append
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 class Job(Base):
@@ -45,36 +124,69 @@ class Job(Base):
     callback_url = Column(String, nullable=True)
     output_format = Column(String, default="binary")
     result_data = Column(Text, nullable=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), nullable=False)
 
 Base.metadata.create_all(bind=engine)
 
 # --- WebSocket Connection Manager ---
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+        # job_id -> (websocket, connected_at monotonic timestamp)
+        self.active_connections: dict[str, tuple[WebSocket, float]] = {}
 
-    async def connect(self, job_id: str, websocket: WebSocket):
+    async def connect(self, job_id: str, websocket: WebSocket) -> bool:
         await websocket.accept()
-        self.active_connections[job_id] = websocket
-        print(f"[WS-CONN] WebSocket connected for job_id: {job_id}")
-
-    def disconnect(self, job_id: str):
-        if job_id in self.active_connections:
+        if len(self.active_connections) >= MAX_WS_CONNECTIONS:
+            # Closing before accept would surface as an HTTP 403; 1013 = "try again later"
+            await websocket.close(code=1013)
+            logger.warning("[WS-REJECT] Connection limit reached, closed job_id %s with 1013", job_id)
+            return False
+        self.active_connections[job_id] = (websocket, time.monotonic())
+        logger.info("[WS-CONN] WebSocket connected for job_id: %s", job_id)
+        return True
+
+    def disconnect(self, job_id: str, websocket: WebSocket = None):
+        entry = self.active_connections.get(job_id)
+        # Only evict the socket we were asked about, not a newer one registered under the same job_id
+        if entry and (websocket is None or entry[0] is websocket):
             del self.active_connections[job_id]
-            print(f"[WS-DCONN] WebSocket disconnected for job_id: {job_id}")
+            logger.info("[WS-DCONN] WebSocket disconnected for job_id: %s", job_id)
 
     async def send_result(self, job_id: str, data: dict):
         if job_id in self.active_connections:
-            websocket = self.active_connections[job_id]
+            websocket, _ = self.active_connections[job_id]
             try:
-                print(f"[WS-SEND] Sending result to job {job_id}: {data}")
-                await websocket.send_json(data)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("[WS-SEND] Sending result to job %s: %s", job_id, data)
+                await websocket.send_bytes(orjson.dumps(data))
             except Exception as e:
-                print(f"[ERROR] Failed to send WebSocket message for job {job_id}: {e}")
+                logger.error("Failed to send WebSocket message for job %s: %s", job_id, e)
+                self.disconnect(job_id, websocket)
+
+    async def sweep(self):
+        """Closes and evicts sockets older than WS_MAX_AGE_SECONDS whose job is no longer pending.
+
+        Disconnects are already handled by websocket_endpoint; this catches clients that keep
+        a socket open after their result was delivered, or for a job that will never finish.
+        """
+        now = time.monotonic()
+        waiting = {job.job_id for job in pending_jobs.values()}
+        for job_id, (websocket, connected_at) in list(self.active_connections.items()):
+            if now - connected_at < WS_MAX_AGE_SECONDS or job_id in waiting:
+                continue
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+            self.disconnect(job_id, websocket)
 
 manager = ConnectionManager()
 
+async def sweep_stale_websockets():
+    while True:
+        await asyncio.sleep(WS_SWEEP_INTERVAL_SECONDS)
+        await manager.sweep()
+
 # --- DB Cleanup Function ---
 def cleanup_old_jobs():
     db = SessionLocal()
@@ -84,19 +196,118 @@ def cleanup_old_jobs():
         all_cutoff = datetime.now() - timedelta(days=JOB_HISTORY_DAYS)
         db.query(Job).filter(Job.created_at < all_cutoff).delete()
         db.commit()
-        print("[INFO] Old jobs cleaned up.")
+        logger.info("Old jobs cleaned up.")
+    finally:
+        db.close()
+
+def load_pending_jobs():
+    """Rebuilds the in-memory pending_jobs index from recent queued jobs left over from a previous run.
+
+    Older queued jobs are marked failed rather than reloaded, so a long-orphaned prompt that
+    still sits in ComfyUI's history never has its result delivered to a stale callback.
+    """
+    db = SessionLocal()
+    try:
+        reload_cutoff = datetime.now(timezone.utc) - timedelta(hours=PENDING_JOB_RELOAD_HOURS)
+        expired = db.query(Job).filter(Job.status == 'queued', Job.created_at < reload_cutoff).update({"status": "failed"})
+        db.commit()
+        for job in db.query(Job).filter(Job.status == 'queued', Job.comfy_prompt_id.isnot(None)):
+            pending_jobs[job.comfy_prompt_id] = PendingJob(job.job_id, job.callback_type, job.callback_url, job.output_format)
+        logger.info("Loaded %d pending jobs, expired %d.", len(pending_jobs), expired)
     finally:
         db.close()
 
+def mark_jobs_failed(job_ids: list[str]):
+    db = SessionLocal()
+    try:
+        db.execute(update(Job), [{"job_id": job_id, "status": "failed"} for job_id in job_ids])
+        db.commit()
+    finally:
+        db.close()
+
+async def fetch_history_outputs(prompt_id: str) -> dict | None:
+    """Returns a finished prompt's outputs from ComfyUI's /history, or None if it has no entry."""
+    response = await app.state.http.get(f"/history/{prompt_id}")
+    response.raise_for_status()
+    history_data = response.json()
+    if prompt_id not in history_data:
+        return None
+    return history_data[prompt_id].get('outputs', {})
+
+async def recover_pending_jobs():
+    """Settles pending jobs whose prompt finished, or vanished, while ComfyUI was not connected.
+
+    Runs after every (re)connect. Finished prompts are completed from /history; prompts ComfyUI
+    no longer knows about are marked failed. Prompts still queued or running keep waiting for
+    their events.
+    """
+    if not pending_jobs:
+        return
+    client = app.state.http
+    try:
+        queue_response = await client.get("/queue")
+        queue_response.raise_for_status()
+        queue_data = queue_response.json()
+        # Queue entries are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+        queued_ids = {item[1] for key in ("queue_running", "queue_pending") for item in queue_data.get(key, [])}
+    except Exception as e:
+        logger.error("Could not read the ComfyUI queue to recover pending jobs: %s", e)
+        return
+
+    lost = []
+    for prompt_id in list(pending_jobs):
+        if prompt_id in queued_ids or prompt_id in submitting_prompts:
+            continue
+        try:
+            outputs = await fetch_history_outputs(prompt_id)
+        except Exception as e:
+            logger.error("Could not read ComfyUI history for prompt %s: %s", prompt_id, e)
+            continue
+        if outputs is not None:
+            logger.info("[RECOVER] Prompt %s finished while ComfyUI was not connected.", prompt_id)
+            await handle_job_completion(prompt_id, outputs)
+        elif prompt_id in pending_jobs:
+            history_prompts.discard(prompt_id)
+            lost.append(pending_jobs.pop(prompt_id).job_id)
+
+    if lost:
+        await asyncio.to_thread(mark_jobs_failed, lost)
+        logger.info("[RECOVER] Marked %d job(s) unknown to ComfyUI as failed.", len(lost))
+
 # --- Lifespan Event Handler ---
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    print(f"[INFO] Gatekeeper starting up.")
+    log_listener.start()
+    logger.info("Gatekeeper starting up.")
     cleanup_old_jobs()
+    load_pending_jobs()
+    app.state.http = httpx.AsyncClient(
+        base_url=f"http://{COMFYUI_ADDRESS}",
+        limits=httpx.Limits(
+            max_keepalive_connections=COMFYUI_MAX_KEEPALIVE_CONNECTIONS,
+            max_connections=COMFYUI_MAX_CONNECTIONS,
+            keepalive_expiry=COMFYUI_KEEPALIVE_EXPIRY_SECONDS
+        ),
+        timeout=httpx.Timeout(30.0)
+    )
     task = asyncio.create_task(listen_to_comfyui())
+    sweeper = asyncio.create_task(sweep_stale_websockets())
+    flusher = asyncio.create_task(flush_completions())
     yield
-    print("[INFO] Gatekeeper server shutting down.")
+    logger.info("Gatekeeper server shutting down.")
     task.cancel()
+    sweeper.cancel()
+    flusher.cancel()
+    # Let the flusher write the batch it was holding before draining what is left
+    await asyncio.gather(flusher, return_exceptions=True)
+    # Write out anything the flusher had not picked up yet
+    leftover = []
+    while not completion_queue.empty():
+        leftover.append(completion_queue.get_nowait())
+    if leftover:
+        mark_jobs_completed(leftover)
+    await app.state.http.aclose()
+    log_listener.stop()
 
 # --- FastAPI Application ---
 app = FastAPI(title="Yak ComfyUI Gatekeeper", lifespan=lifespan)
@@ -109,153 +320,195 @@ def get_db():
         db.close()
 
 def randomize_seed(workflow):
+    # getrandbits is a single C call, with none of randint's range-rejection overhead
+    rb = random.getrandbits
     for node in workflow.values():
         if node.get("class_type") == "KSampler":
-            node["inputs"]["seed"] = random.randint(0, 9999)
+            node["inputs"]["seed"] = rb(63)
     return workflow
 
 # --- API Endpoints ---
 @app.post("/execute")
 async def execute_workflow(request: Request, db: Session = Depends(get_db)):
-    payload = await request.json()
+    payload = orjson.loads(await request.body())
+    # ComfyUI accepts a caller-chosen prompt_id, so the job can be registered before submission
+    # and events that race ahead of the /prompt response still find it
+    prompt_id = str(uuid.uuid4())
     new_job = Job(
         job_id=str(uuid.uuid4()),
         n8n_execution_id=payload['n8n_execution_id'],
+        comfy_prompt_id=prompt_id,
         callback_type=payload['callback_type'],
         callback_url=payload.get('callback_url'),
         output_format=payload.get('output_format', 'binary'),
-        status="pending_submission"
+        status="queued"
     )
     db.add(new_job)
     db.commit()
+    pending_jobs[prompt_id] = PendingJob(
+        new_job.job_id, new_job.callback_type, new_job.callback_url, new_job.output_format
+    )
+    submitting_prompts.add(prompt_id)
 
     try:
         randomized_workflow = randomize_seed(payload['workflow_json'])
-        comfy_payload = {"prompt": randomized_workflow}
-        async with httpx.AsyncClient() as client:
-            response = await client.post(f"http://{COMFYUI_ADDRESS}/prompt", json=comfy_payload)
-            response.raise_for_status()
-            comfy_response = response.json()
-
-        new_job.comfy_prompt_id = comfy_response['prompt_id']
-        new_job.status = "queued"
-        db.commit()
-        db.refresh(new_job)
-        print(f"[INFO] Job {new_job.job_id} submitted to ComfyUI. Prompt ID: {new_job.comfy_prompt_id}")
+        # ComfyUI only sends executed/executing events to the WS session with this client_id
+        comfy_payload = {"prompt": randomized_workflow, "client_id": CLIENT_ID, "prompt_id": prompt_id}
+        client = app.state.http
+        response = await client.post("/prompt", json=comfy_payload)
+        response.raise_for_status()
+        logger.info("Job %s submitted to ComfyUI. Prompt ID: %s", new_job.job_id, prompt_id)
         return {"status": "success", "job_id": new_job.job_id}
     except Exception as e:
+        pending_jobs.pop(prompt_id, None)
         new_job.status = "submission_failed"
         db.commit()
         raise HTTPException(status_code=500, detail=f"Failed to communicate with ComfyUI: {e}")
+    finally:
+        submitting_prompts.discard(prompt_id)
 
 @app.websocket("/ws/{job_id}")
 async def websocket_endpoint(websocket: WebSocket, job_id: str):
-    await manager.connect(job_id, websocket)
+    if not await manager.connect(job_id, websocket):
+        return
     try:
+        # Raw receive() avoids decoding client frames we never use
         while True:
-            await websocket.receive_text()
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
     except WebSocketDisconnect:
-        manager.disconnect(job_id)
+        pass
+    finally:
+        manager.disconnect(job_id, websocket)
 
 # --- ComfyUI WebSocket Listener ---
 async def listen_to_comfyui():
-    global last_queue_remaining, last_prompt_id
-    ws_url = f"ws://{COMFYUI_ADDRESS}/ws"
+    ws_url = f"ws://{COMFYUI_ADDRESS}/ws?clientId={CLIENT_ID}"
     
     while True:
         try:
-            async with websockets.connect(ws_url) as websocket:
-                print(f"[INFO] WebSocket connection to ComfyUI established.")
+            # permessage-deflate only costs CPU on a localhost link
+            async with websockets.connect(ws_url, compression=None, max_size=16 * 1024 * 1024, ping_interval=20) as websocket:
+                logger.info("WebSocket connection to ComfyUI established.")
+                # Anything pending now may have missed events while there was no connection
+                history_prompts.update(pending_jobs)
+                await recover_pending_jobs()
                 async for message in websocket:
+                    # ComfyUI sends JSON as text frames; binary frames are preview images we never use
+                    if isinstance(message, bytes):
+                        continue
+                    # Skip status/progress ticks before paying for a full JSON parse
+                    if '"executed"' not in message and '"executing"' not in message:
+                        continue
                     try:
-                        data = json.loads(message)
-                        print(f"[WS-RECV] {data}")
+                        data = orjson.loads(message)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("[WS-RECV] %s", data)
                         
                         if not isinstance(data, dict):
                             continue
 
-                        # Handle status messages - track queue remaining
-                        if data.get('type') == 'status':
-                            status_data = data.get('data', {}).get('status', {})
-                            exec_info = status_data.get('exec_info', {})
-                            current_queue = exec_info.get('queue_remaining')
-                            
-                            if current_queue is not None:
-                                print(f"[QUEUE] Current: {current_queue}, Last: {last_queue_remaining}")
-                                
-                                # Check if queue decreased (job completed)
-                                if last_queue_remaining is not None and current_queue < last_queue_remaining and last_prompt_id:
-                                    print(f"[COMPLETED] Job finished! Queue went from {last_queue_remaining} to {current_queue}")
-                                    await handle_job_completion(last_prompt_id)
-                                
-                                last_queue_remaining = current_queue
-
-                        # Handle progress_state messages - track prompt_id
-                        elif data.get('type') == 'progress_state':
-                            progress_data = data.get('data', {})
-                            prompt_id = progress_data.get('prompt_id')
-                            if prompt_id:
-                                last_prompt_id = prompt_id
-                                print(f"[PROMPT-ID] Updated to: {prompt_id}")
+                        msg_type = data.get('type')
+                        msg_data = data.get('data') or {}
+                        prompt_id = msg_data.get('prompt_id')
+
+                        # Handle executed messages - collect each output node's result inline
+                        if msg_type == 'executed' and prompt_id in pending_jobs:
+                            node_id = msg_data.get('node')
+                            executed_outputs.setdefault(prompt_id, {})[node_id] = msg_data.get('output') or {}
+
+                        # Handle executing messages - a null node means the prompt has finished
+                        elif msg_type == 'executing' and prompt_id and msg_data.get('node') is None:
+                            logger.info("[COMPLETED] Prompt %s finished executing.", prompt_id)
+                            outputs = executed_outputs.pop(prompt_id, {})
+                            if prompt_id in history_prompts and prompt_id in pending_jobs:
+                                try:
+                                    outputs = await fetch_history_outputs(prompt_id) or outputs
+                                except Exception as e:
+                                    logger.error("Could not read ComfyUI history for prompt %s: %s", prompt_id, e)
+                            await handle_job_completion(prompt_id, outputs)
 
                     except Exception as e:
-                        print(f"[ERROR] Error processing WebSocket message: {e}")
+                        logger.error("Error processing WebSocket message: %s", e)
         except Exception as e:
-            print(f"[ERROR] WebSocket listener error: {e}. Reconnecting in 5s...")
+            logger.error("WebSocket listener error: %s. Reconnecting in 5s...", e)
             await asyncio.sleep(5)
 
-async def handle_job_completion(prompt_id: str):
-    """Handle job completion using the prompt_id"""
+def mark_jobs_completed(completions: list[tuple[str, str]]):
+    """Writes a batch of completions in one transaction."""
     db = SessionLocal()
     try:
-        # Find the job by prompt_id
-        job = db.query(Job).filter(Job.comfy_prompt_id == prompt_id).first()
-        if not job or job.status == 'completed':
-            print(f"[SKIP] Job not found or already completed for prompt_id: {prompt_id}")
-            return
+        db.execute(update(Job), [
+            {"job_id": job_id, "status": "completed", "result_data": result_data}
+            for job_id, result_data in completions
+        ])
+        db.commit()
+    finally:
+        db.close()
 
-        # Get history data from ComfyUI
-        async with httpx.AsyncClient() as client:
-            history_response = await client.get(f"http://{COMFYUI_ADDRESS}/history/{prompt_id}")
-            history_response.raise_for_status()
-            history_data = history_response.json()
+async def flush_completions():
+    """Coalesces completions for up to COMPLETION_FLUSH_INTERVAL_SECONDS so a burst costs one commit."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await completion_queue.get()]
+        try:
+            deadline = loop.time() + COMPLETION_FLUSH_INTERVAL_SECONDS
+            while len(batch) < COMPLETION_FLUSH_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(completion_queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+            await asyncio.to_thread(mark_jobs_completed, batch)
+            logger.info("[DB] Marked %d job(s) as completed.", len(batch))
+        except asyncio.CancelledError:
+            # Shutting down: the batch is already off the queue, so write it here or it is lost
+            mark_jobs_completed(batch)
+            raise
+        except Exception as e:
+            logger.error("Failed to write %d completed job(s): %s", len(batch), e)
 
-        if prompt_id not in history_data:
-            print(f"[ERROR] No history found for prompt_id: {prompt_id}")
+async def handle_job_completion(prompt_id: str, output_data: dict):
+    """Handle job completion using the prompt_id and the outputs collected from `executed` messages"""
+    try:
+        client = app.state.http
+
+        job = pending_jobs.pop(prompt_id, None)
+        history_prompts.discard(prompt_id)
+        if not job:
+            logger.info("[SKIP] Job not found or already completed for prompt_id: %s", prompt_id)
             return
 
-        output_data = history_data[prompt_id].get('outputs', {})
-        
-        # Update job status
-        job.status = "completed"
-        job.result_data = json.dumps(output_data)
-        db.commit()
-        print(f"[DB] Job {job.job_id} marked as completed.")
+        # The status write is batched by flush_completions; delivery doesn't wait for it
+        # Encode the outputs once; the same string is stored and reused for text payloads
+        result_data = orjson.dumps(output_data).decode()
+        completion_queue.put_nowait((job.job_id, result_data))
 
         # Format the output
-        final_payload = await format_output(job, output_data)
+        final_payload = await format_output(job, output_data, result_data)
 
         # Send result
         if job.callback_type == 'websocket':
             await manager.send_result(job.job_id, final_payload)
-            print(f"[WS-PUSH] Pushed result for job {job.job_id}.")
+            logger.info("[WS-PUSH] Pushed result for job %s.", job.job_id)
         elif job.callback_type == 'webhook' and job.callback_url:
-            print(f"[WEBHOOK] Sending result for job {job.job_id} to {job.callback_url}")
-            async with httpx.AsyncClient() as client:
-                await client.post(job.callback_url, json=final_payload)
+            logger.info("[WEBHOOK] Sending result for job %s to %s", job.job_id, job.callback_url)
+            # Absolute URLs bypass the client's ComfyUI base_url
+            await client.post(job.callback_url, content=orjson.dumps(final_payload), headers={"Content-Type": "application/json"})
 
     except Exception as e:
-        print(f"[ERROR] Error handling job completion for {prompt_id}: {e}")
-    finally:
-        db.close()
+        logger.error("Error handling job completion for %s: %s", prompt_id, e)
 
 # --- Output Formatting Logic ---
-async def format_output(job: Job, output_data: dict) -> dict:
+async def format_output(job, output_data: dict, result_data: str) -> dict:
     """Prepares the final payload based on the job's requested output format."""
 
-    # For text format, return the history data
+    # For text format, return the raw node outputs
     if job.output_format == 'text':
-        return {"format": "text", "data": json.dumps(output_data)}
+        return {"format": "text", "data": result_data}
 
     # Find all output files
     files = []
@@ -268,61 +521,76 @@ async def format_output(job: Job, output_data: dict) -> dict:
             files.extend([{'filename': aud['filename'], 'type': 'audio'} for aud in node_output['audio']])
 
     if not files:
-        return {"format": "text", "data": json.dumps(output_data)}
+        return {"format": "text", "data": result_data}
 
-    results = []
-    for file_info in files:
+    async def fetch_one(file_info: dict) -> dict:
         filename = file_info['filename']
         file_type = file_info['type']
-
-        if job.output_format == 'filePath':
-            # Construct real filesystem path
-            gatekeeper_dir = Path(__file__).parent.absolute()
-            file_path = gatekeeper_dir / "ComfyUI" / "output" / filename
-            
-            results.append({
+        try:
+            client = app.state.http
+            # Stream into a single buffer instead of holding response.content as well
+            binary_data = bytearray()
+            async with client.stream("GET", "/view", params={"filename": filename}) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    binary_data += chunk
+            base64_data = base64.b64encode(binary_data).decode('ascii')
+            del binary_data
+
+            # Determine MIME type
+            mime_type = MIME_BY_EXT.get(filename.rsplit('.', 1)[-1].lower(), "application/octet-stream")
+
+            return {
+                "format": "binary",
+                "type": file_type,
+                "data": base64_data,
+                "filename": filename,
+                "mime_type": mime_type
+            }
+        except Exception as e:
+            logger.error("Failed to fetch binary data for %s: %s", filename, e)
+            # Fallback to filePath
+            return {
                 "format": "filePath",
                 "type": file_type,
-                "data": str(file_path),
-                "filename": filename
-            })
-        elif job.output_format == 'binary':
-            try:
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(f"http://{COMFYUI_ADDRESS}/view?filename={filename}")
-                    response.raise_for_status()
-                    binary_data = response.content
-                    base64_data = base64.b64encode(binary_data).decode('utf-8')
-
-                    # Determine MIME type
-                    ext = filename.lower().split('.')[-1]
-                    mime_type = "application/octet-stream"
-                    if ext in ['png', 'jpg', 'jpeg', 'gif', 'webp']:
-                        mime_type = f"image/{ext if ext != 'jpg' else 'jpeg'}"
-                    elif ext in ['mp4', 'avi', 'mov', 'webm']:
-                        mime_type = f"video/{ext}"
-                    elif ext in ['mp3', 'wav', 'ogg', 'flac']:
-                        mime_type = f"audio/{ext}"
-
-                    results.append({
-                        "format": "binary",
-                        "type": file_type,
-                        "data": base64_data,
-                        "filename": filename,
-                        "mime_type": mime_type
-                    })
-            except Exception as e:
-                print(f"[ERROR] Failed to fetch binary data for {filename}: {e}")
-                # Fallback to filePath
-                gatekeeper_dir = Path(__file__).parent.absolute()
-                file_path = gatekeeper_dir / "ComfyUI" / "output" / filename
-                results.append({
-                    "format": "filePath",
-                    "type": file_type,
-                    "data": str(file_path),
-                    "filename": filename,
-                    "error": str(e)
-                })
+                "data": str(OUTPUT_DIR / filename),
+                "filename": filename,
+                "error": str(e)
+            }
+
+    async def ensure_local(file_info: dict) -> dict:
+        filename = file_info['filename']
+        file_path = OUTPUT_DIR / filename
+        result = {
+            "format": "filePath",
+            "type": file_info['type'],
+            "data": str(file_path),
+            "filename": filename
+        }
+        if file_path.exists():
+            return result
+
+        # ComfyUI is on another host: stream the file into place without holding it in memory
+        try:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            part_path = file_path.with_name(file_path.name + ".part")
+            async with app.state.http.stream("GET", "/view", params={"filename": filename}) as response:
+                response.raise_for_status()
+                async with aiofiles.open(part_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(65536):
+                        await f.write(chunk)
+            os.replace(part_path, file_path)
+        except Exception as e:
+            logger.error("Failed to download %s into the output directory: %s", filename, e)
+            result["error"] = str(e)
+        return result
+
+    results = []
+    if job.output_format == 'filePath':
+        results = list(await asyncio.gather(*[ensure_local(file_info) for file_info in files]))
+    elif job.output_format == 'binary':
+        # Fetch all files concurrently over the shared connection pool
+        results = list(await asyncio.gather(*[fetch_one(file_info) for file_info in files]))
 
     return results[0] if len(results) == 1 else {"format": "multiple", "results": results}
 
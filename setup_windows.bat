@@ -114,7 +114,7 @@ echo.
 
 :: --- Step 7: Install Gatekeeper Dependencies ---
 echo [STEP 7/8] Installing Gatekeeper service dependencies...
-cmd /c "conda run -n !ENV_NAME! pip install fastapi ""uvicorn[standard]"" sqlalchemy httpx websockets"
+cmd /c "conda run -n !ENV_NAME! pip install fastapi ""uvicorn[standard]"" sqlalchemy httpx websockets orjson aiofiles"
 if !errorlevel! neq 0 ( echo [ERROR] Failed to install Gatekeeper dependencies. & pause & goto :eof )
 echo [SUCCESS] Gatekeeper dependencies installed.
 echo.
@@ -1,11 +1,38 @@
+import asyncio
+import hashlib
 import os
 import json
 import subprocess
-import requests
-import gdown
+import re
 from pathlib import Path
-from typing import Dict, List, Any, Set
+from typing import Dict, List, Any, Set, Tuple, Union
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# Written next to a node's requirements.txt after pip installs it successfully
+REQUIREMENTS_STAMP_NAME = '.yak_reqs.sha256'
+
+# Below this many paths a plain loop of stat() calls beats the thread pool's overhead
+_BATCH_EXISTS_THRESHOLD = 32
+
+def _batch_exists(paths: List[Any]) -> List[bool]:
+    """Check many paths for existence, keeping several stat() calls in flight on large batches.
+    
+    Metadata lookups on a cold cache or a network share are latency bound, and
+    os.stat releases the GIL, so overlapping them in threads hides most of that
+    latency. Results are returned in the same order as paths.
+    """
+    if len(paths) < _BATCH_EXISTS_THRESHOLD:
+        return [os.path.exists(p) for p in paths]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        return list(executor.map(os.path.exists, paths))
 
 class WorkflowSetupManager:
     def __init__(self, tools_dir: str = None):
@@ -21,50 +48,89 @@ class WorkflowSetupManager:
         self.comfyui_dir = self.root_dir / "ComfyUI"  # Adjust if different
         self.custom_nodes_dir = self.comfyui_dir / "custom_nodes"
         self.models_dir = self.comfyui_dir / "models"
+        # String forms for os.path joins in per-node/per-model loops
+        self._custom_nodes_dir_s = str(self.custom_nodes_dir)
+        self._models_dir_s = str(self.models_dir)
         
+        # One pooled HTTP session shared by every model download, created on first use
+        self._http = None
+        self._http_lock = threading.Lock()
+        
+        # Wheel cache shared by every custom node's pip install
+        self._pip_cache = self.tools_dir / ".pip_cache"
+        
+        # Memoized scan/dependency results; see invalidate_dependency_cache()
+        self._workflows_cache = None
+        self._deps_cache = None
+        
+    def invalidate_dependency_cache(self):
+        """Forget cached workflow and dependency scans after workflows change on disk."""
+        self._workflows_cache = None
+        self._deps_cache = None
+    
     def scan_workflows(self) -> List[str]:
         """Get list of available workflow folders."""
+        if self._workflows_cache is None:
+            self._workflows_cache = self._scan_workflows()
+        return self._workflows_cache
+    
+    def _scan_workflows(self) -> List[str]:
         if not self.workflows_dir.exists():
             return []
         
-        workflows = []
-        for item in self.workflows_dir.iterdir():
-            if item.is_dir() and (item / "workflow.json").exists():
-                workflows.append(item.name)
-        return workflows
+        # DirEntry.is_dir() uses the type returned by readdir; only symlinks still need a stat()
+        with os.scandir(self.workflows_dir) as entries:
+            candidates = [entry for entry in entries if entry.is_dir()]
+        
+        # Probe every workflow.json in one batch rather than one stat per loop iteration
+        probes = _batch_exists([os.path.join(entry.path, "workflow.json") for entry in candidates])
+        return [entry.name for entry, exists in zip(candidates, probes) if exists]
     
     def load_workflow_config(self, workflow_name: str) -> Dict[str, Any]:
         """Load complete workflow configuration."""
         workflow_path = self.workflows_dir / workflow_name
         
         config = {}
-        for file_name in ["workflow.json", "ui_inputs.json", "dependencies.json"]:
-            file_path = workflow_path / file_name
-            if file_path.exists():
-                with open(file_path, 'r') as f:
-                    config[file_name.replace('.json', '')] = json.load(f)
+        # One directory listing instead of an exists() probe per config file
+        try:
+            with os.scandir(workflow_path) as entries:
+                present = {entry.name for entry in entries if entry.is_file()}
+        except FileNotFoundError:
+            return config
+        
+        for file_name in ("workflow.json", "ui_inputs.json", "dependencies.json"):
+            if file_name in present:
+                # Parse the raw bytes; both orjson and json accept them without a text decode step
+                config[file_name[:-5]] = _json_loads((workflow_path / file_name).read_bytes())
         
         return config
     
     def get_all_dependencies(self) -> Dict[str, List[Dict]]:
         """Consolidate dependencies from all workflows."""
-        all_custom_nodes = []
-        all_models = []
+        if self._deps_cache is None:
+            self._deps_cache = self._compute_dependencies()
+        return self._deps_cache
+    
+    def _compute_dependencies(self) -> Dict[str, List[Dict]]:
+        # Deduplicate by name while accumulating; a later workflow's entry replaces an earlier one
+        unique_nodes: Dict[str, Dict] = {}
+        unique_models: Dict[str, Dict] = {}
         
-        for workflow_name in self.scan_workflows():
-            config = self.load_workflow_config(workflow_name)
+        # Overlap the file reads; they are latency bound on network-mounted workflow folders
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            configs = list(executor.map(self.load_workflow_config, self.scan_workflows()))
+        
+        for config in configs:
             deps = config.get('dependencies', {})
             
-            all_custom_nodes.extend(deps.get('custom_nodes', []))
-            all_models.extend(deps.get('models', []))
-        
-        # Remove duplicates by name
-        unique_nodes = {node['name']: node for node in all_custom_nodes}.values()
-        unique_models = {model['name']: model for model in all_models}.values()
+            for node in deps.get('custom_nodes', []):
+                unique_nodes[node['name']] = node
+            for model in deps.get('models', []):
+                unique_models[model['name']] = model
         
         return {
-            'custom_nodes': list(unique_nodes),
-            'models': list(unique_models)
+            'custom_nodes': list(unique_nodes.values()),
+            'models': list(unique_models.values())
         }
     
     def get_installed_custom_nodes(self) -> Set[str]:
@@ -72,58 +138,180 @@ class WorkflowSetupManager:
         if not self.custom_nodes_dir.exists():
             return set()
         
-        installed = set()
-        for item in self.custom_nodes_dir.iterdir():
-            if item.is_dir() and not item.name.startswith('.'):
-                installed.add(item.name)
-        return installed
+        with os.scandir(self.custom_nodes_dir) as entries:
+            return {
+                entry.name for entry in entries
+                if entry.is_dir() and not entry.name.startswith('.')
+            }
     
-    def install_custom_node(self, node_info: Dict[str, Any]) -> bool:
-        """Install or update a single custom node."""
+    def install_custom_node(self, node_info: Dict[str, Any], install_requirements: bool = True) -> bool:
+        """Install or update a single custom node.
+        
+        Pass install_requirements=False when the caller batches requirements
+        through install_requirements() instead.
+        """
+        return asyncio.run(self._install_custom_node_async(node_info, install_requirements))
+    
+    async def _run_async(self, cmd: List[str], env: Dict[str, str] = None, capture_stdout: bool = False) -> Tuple[int, str, str]:
+        """Run a subprocess without blocking the event loop; returns (returncode, stdout, stderr).
+        
+        stdout is discarded unless capture_stdout is set, so chatty git/pip
+        progress output never piles up in memory.
+        """
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        stdout, stderr = await process.communicate()
+        return process.returncode, (stdout or b'').decode(errors='replace'), stderr.decode(errors='replace')
+    
+    async def _install_custom_node_async(self, node_info: Dict[str, Any], install_requirements: bool = True) -> bool:
+        node_name = node_info.get('name', '')
         try:
             repo_url = node_info.get('repo', '')
-            node_name = node_info.get('name', '')
             
             if not repo_url or not node_name:
                 print(f"Invalid node info: {node_info}")
                 return False
             
             node_path = self.custom_nodes_dir / node_name
+            # Fail fast instead of hanging on a credentials prompt
+            git_env = {**os.environ, 'GIT_TERMINAL_PROMPT': '0'}
             
             if node_path.exists():
-                print(f"Updating custom node: {node_name}")
-                # Update existing node
-                result = subprocess.run(
-                    ['git', 'pull'], 
-                    cwd=node_path, 
-                    capture_output=True, 
-                    text=True
+                # One tiny ls-remote round trip avoids a fetch when nothing has changed upstream
+                remote_head, local_head = await asyncio.gather(
+                    self._remote_head(repo_url, git_env), self._local_head(node_path, git_env)
                 )
-                print(f"Update result: {result.stdout}")
+                if remote_head and remote_head == local_head:
+                    # Skip only the fetch; the requirements stamp check below still runs
+                    print(f"Custom node {node_name} is up to date")
+                    returncode = 0
+                else:
+                    print(f"Updating custom node: {node_name}")
+                    # Update to the remote HEAD (the ref _remote_head compares) without fetching history;
+                    # naming it keeps FETCH_HEAD on that branch even for detached or untracked checkouts
+                    returncode, _, stderr = await self._run_async(
+                        ['git', '-C', str(node_path), 'fetch', '--depth=1', 'origin', 'HEAD'], env=git_env
+                    )
+                    if returncode == 0:
+                        returncode, _, stderr = await self._run_async(
+                            ['git', '-C', str(node_path), 'reset', '--hard', 'FETCH_HEAD'], env=git_env
+                        )
+                    if returncode != 0:
+                        print(f"Update of {node_name} failed: {stderr}")
             else:
                 print(f"Installing custom node: {node_name}")
-                # Clone new node
-                result = subprocess.run(
-                    ['git', 'clone', repo_url, str(node_path)],
-                    capture_output=True,
-                    text=True
+                # Clone new node; only HEAD is needed
+                returncode, _, stderr = await self._run_async(
+                    ['git', 'clone', '--depth=1', '--filter=blob:none', '--single-branch', repo_url, str(node_path)],
+                    env=git_env
                 )
-                print(f"Install result: {result.stdout}")
+                if returncode != 0:
+                    print(f"Install of {node_name} failed: {stderr}")
             
             # Install requirements if they exist
             requirements_file = node_path / "requirements.txt"
-            if requirements_file.exists():
-                print(f"Installing requirements for {node_name}")
-                subprocess.run([
-                    'pip', 'install', '-r', str(requirements_file)
-                ], capture_output=True)
+            if install_requirements and requirements_file.exists():
+                digest = self._requirements_digest(requirements_file)
+                if digest != self._read_requirements_stamp(requirements_file):
+                    print(f"Installing requirements for {node_name}")
+                    pip_returncode, _, pip_stderr = await self._run_async(
+                        self._pip_install_cmd([requirements_file]), env=self._pip_env()
+                    )
+                    if pip_returncode == 0:
+                        self._write_requirements_stamp(requirements_file, digest)
+                    else:
+                        print(f"Failed to install requirements for {node_name}: {pip_stderr}")
             
-            return result.returncode == 0
+            return returncode == 0
             
         except Exception as e:
             print(f"Error installing custom node {node_name}: {str(e)}")
             return False
     
+    async def _remote_head(self, repo_url: str, env: Dict[str, str] = None) -> str:
+        """SHA of the remote's HEAD, or '' if it can't be determined."""
+        returncode, stdout, _ = await self._run_async(['git', 'ls-remote', repo_url, 'HEAD'], env=env, capture_stdout=True)
+        if returncode != 0 or not stdout.strip():
+            return ''
+        return stdout.split()[0]
+    
+    async def _local_head(self, node_path: Path, env: Dict[str, str] = None) -> str:
+        """SHA of the checked-out HEAD, or '' if it can't be determined."""
+        returncode, stdout, _ = await self._run_async(
+            ['git', '-C', str(node_path), 'rev-parse', 'HEAD'], env=env, capture_stdout=True
+        )
+        return stdout.strip() if returncode == 0 else ''
+    
+    async def _install_custom_nodes_async(self, nodes: List[Dict[str, Any]], max_parallel: int) -> List[bool]:
+        """Install/update nodes concurrently, at most max_parallel at a time."""
+        semaphore = asyncio.Semaphore(max_parallel)
+        
+        async def install(node):
+            async with semaphore:
+                return await self._install_custom_node_async(node, install_requirements=False)
+        
+        return await asyncio.gather(*(install(node) for node in nodes))
+    
+    def _pip_env(self) -> Dict[str, str]:
+        """Point pip at the shared cache so wheels fetched for one node satisfy the next offline."""
+        self._pip_cache.mkdir(exist_ok=True)
+        return {**os.environ, 'PIP_CACHE_DIR': str(self._pip_cache), 'PIP_DISABLE_PIP_VERSION_CHECK': '1'}
+    
+    def _pip_install_cmd(self, requirements_files: List[Union[str, Path]]) -> List[str]:
+        cmd = ['pip', 'install', '--prefer-binary', '--upgrade-strategy', 'only-if-needed']
+        for requirements_file in requirements_files:
+            cmd.extend(['-r', str(requirements_file)])
+        return cmd
+    
+    def install_requirements(self, requirements_files: List[Union[str, Path]]) -> bool:
+        """Install several requirements files in a single pip resolver pass.
+        
+        Files whose contents match the stamp left by the last successful
+        install are skipped; if nothing changed, pip is not run at all.
+        """
+        digests = {}
+        for requirements_file in map(Path, requirements_files):
+            digest = self._requirements_digest(requirements_file)
+            if digest != self._read_requirements_stamp(requirements_file):
+                digests[requirements_file] = digest
+        if not digests:
+            return True
+        
+        result = subprocess.run(
+            self._pip_install_cmd(list(digests)),
+            env=self._pip_env(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            check=False
+        )
+        if result.returncode != 0:
+            print(f"pip install failed: {result.stderr}")
+            return False
+        for requirements_file, digest in digests.items():
+            self._write_requirements_stamp(requirements_file, digest)
+        return True
+    
+    def _requirements_digest(self, requirements_file: Path) -> str:
+        with open(requirements_file, 'rb') as f:
+            if hasattr(hashlib, 'file_digest'):
+                # Python 3.11+: hashes in C with the GIL released
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            return hashlib.sha256(f.read()).hexdigest()
+    
+    def _read_requirements_stamp(self, requirements_file: Path) -> str:
+        try:
+            return (requirements_file.parent / REQUIREMENTS_STAMP_NAME).read_text().strip()
+        except OSError:
+            return ''
+    
+    def _write_requirements_stamp(self, requirements_file: Path, digest: str):
+        (requirements_file.parent / REQUIREMENTS_STAMP_NAME).write_text(digest)
+    
     def download_model_from_gdrive(self, model_info: Dict[str, Any]) -> bool:
         """Download model from Google Drive URL."""
         try:
@@ -151,8 +339,11 @@ class WorkflowSetupManager:
             print(f"From: {url}")
             print(f"To: {file_path}")
             
-            # Use gdown for Google Drive downloads
-            gdown.download(url, str(file_path), quiet=False, fuzzy=True)
+            # Stream over the shared session; gdown handles anything we can't (e.g. quota pages)
+            if not self._gdrive_stream(url, file_path):
+                print(f"Falling back to gdown for {name}")
+                import gdown
+                gdown.download(url, str(file_path), quiet=False, fuzzy=True)
             
             return file_path.exists()
             
@@ -160,6 +351,70 @@ class WorkflowSetupManager:
             print(f"Error downloading model {name}: {str(e)}")
             return False
     
+    def _get_http(self):
+        """The shared requests.Session, imported and built lazily so report-only runs skip the HTTP stack."""
+        with self._http_lock:
+            if self._http is None:
+                import requests
+                from http.cookiejar import DefaultCookiePolicy
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+                
+                self._http = requests.Session()
+                self._http.mount('https://', HTTPAdapter(
+                    pool_connections=8,
+                    pool_maxsize=16,
+                    max_retries=Retry(total=3, backoff_factor=0.3)
+                ))
+                # Keep Drive's per-file confirm cookies out of the shared jar; each download
+                # passes its own cookies explicitly
+                self._http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            return self._http
+    
+    def _gdrive_stream(self, url: str, dest: Path) -> bool:
+        """Stream a Google Drive file to dest, answering the large-file confirmation page if shown."""
+        match = re.search(r'/d/([\w-]+)', url) or re.search(r'[?&]id=([\w-]+)', url)
+        if not match:
+            return False
+        
+        download_url = 'https://drive.google.com/uc'
+        params = {'export': 'download', 'id': match.group(1)}
+        http = self._get_http()
+        response = http.get(download_url, params=params, stream=True, timeout=60)
+        
+        if 'text/html' in response.headers.get('Content-Type', ''):
+            # Large files get a virus-scan warning page whose form carries the confirm token
+            page = response.text
+            response.close()
+            action = re.search(r'<form[^>]+action="([^"]+)"', page)
+            fields = dict(re.findall(r'<input[^>]+name="([^"]+)"[^>]+value="([^"]*)"', page))
+            # Only this response's cookies: the session is shared by concurrent downloads
+            cookies = response.cookies
+            cookie_token = next(
+                (v for k, v in cookies.items() if k.startswith('download_warning')), None
+            )
+            if action and fields:
+                download_url, params = action.group(1).replace('&amp;', '&'), fields
+            elif cookie_token:
+                params['confirm'] = cookie_token
+            else:
+                return False
+            response = http.get(download_url, params=params, cookies=cookies, stream=True, timeout=60)
+            if 'text/html' in response.headers.get('Content-Type', ''):
+                response.close()
+                return False
+        
+        # Write to a temporary name so an interrupted download isn't mistaken for a finished model
+        part_path = dest.with_name(dest.name + '.part')
+        with response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            # copyfileobj does the buffering, so a 4 MiB copy size means few, large write() calls
+            with open(part_path, 'wb', buffering=0) as f:
+                shutil.copyfileobj(response.raw, f, length=4 * 1024 * 1024)
+        os.replace(part_path, dest)
+        return True
+    
     def manage_all_custom_nodes(self) -> Dict[str, Any]:
         """Install/update required nodes and remove unused ones."""
         required_nodes = self.get_all_dependencies()['custom_nodes']
@@ -174,26 +429,36 @@ class WorkflowSetupManager:
             'failed': []
         }
         
-        # Install/update required nodes
-        for node in required_nodes:
+        # Install/update required nodes concurrently; git clone/fetch is network bound
+        max_parallel = int(os.environ.get("YAK_PARALLEL", 8))
+        outcomes = asyncio.run(self._install_custom_nodes_async(required_nodes, max_parallel))
+        for node, succeeded in zip(required_nodes, outcomes):
             node_name = node['name']
-            if node_name in installed_nodes:
-                if self.install_custom_node(node):
-                    results['updated'].append(node_name)
-                else:
-                    results['failed'].append(node_name)
+            if not succeeded:
+                results['failed'].append(node_name)
+            elif node_name in installed_nodes:
+                results['updated'].append(node_name)
             else:
-                if self.install_custom_node(node):
-                    results['installed'].append(node_name)
-                else:
-                    results['failed'].append(node_name)
+                results['installed'].append(node_name)
+        
+        # Resolve all node requirements together instead of one pip run per node
+        join = os.path.join
+        custom_nodes_dir_s = self._custom_nodes_dir_s
+        requirements_files = [
+            join(custom_nodes_dir_s, node_name, "requirements.txt")
+            for node_name in results['installed'] + results['updated']
+        ]
+        requirements_files = [p for p, exists in zip(requirements_files, _batch_exists(requirements_files)) if exists]
+        if requirements_files:
+            print(f"Checking requirements for {len(requirements_files)} custom nodes")
+            if not self.install_requirements(requirements_files):
+                print("Failed to install custom node requirements")
         
         # Remove unused nodes
         unused_nodes = installed_nodes - required_node_names
         for node_name in unused_nodes:
             try:
-                node_path = self.custom_nodes_dir / node_name
-                shutil.rmtree(node_path)
+                shutil.rmtree(join(custom_nodes_dir_s, node_name))
                 results['removed'].append(node_name)
                 print(f"Removed unused custom node: {node_name}")
             except Exception as e:
@@ -211,22 +476,67 @@ class WorkflowSetupManager:
             'failed': []
         }
         
+        # One walk of the models tree replaces a stat() per model
+        existing_models = self._index_models()
+        pending = []
         for model in required_models:
             model_name = model['name']
-            if model.get('google_download_url'):
-                if self.download_model_from_gdrive(model):
-                    if (self.models_dir / model.get('install_path', '') / model_name).exists():
-                        results['downloaded'].append(model_name)
-                    else:
-                        results['skipped'].append(model_name)
-                else:
-                    results['failed'].append(model_name)
-            else:
+            if not model.get('google_download_url'):
                 print(f"No download URL for model: {model_name}")
                 results['skipped'].append(model_name)
+            elif f"{model.get('install_path', '').strip('/')}/{model_name}".lstrip('/') in existing_models:
+                print(f"Model {model_name} already exists, skipping download")
+                results['skipped'].append(model_name)
+            else:
+                pending.append(model)
+        
+        # The walk does not descend into symlinked directories, so confirm the misses directly
+        if pending:
+            found = _batch_exists([
+                os.path.join(self._models_dir_s, model.get('install_path', '').strip('/'), model['name'])
+                for model in pending
+            ])
+            for model, exists in zip(pending, found):
+                if exists:
+                    print(f"Model {model['name']} already exists, skipping download")
+                    results['skipped'].append(model['name'])
+            pending = [model for model, exists in zip(pending, found) if not exists]
+        
+        # Download in parallel; capped at 4 workers to stay clear of Google Drive rate limiting
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            futures = {executor.submit(self.download_model_from_gdrive, model): model for model in pending}
+            for future in as_completed(futures):
+                model_name = futures[future]['name']
+                # download_model_from_gdrive only reports success once the file is on disk
+                if future.result():
+                    results['downloaded'].append(model_name)
+                else:
+                    results['failed'].append(model_name)
         
         return results
     
+    def _index_models(self) -> Set[str]:
+        """All files under models_dir, as POSIX paths relative to it.
+        
+        Symlinked directories are listed but not descended into, so a link
+        cycle cannot make the walk run forever.
+        """
+        index = set()
+        if not os.path.isdir(self._models_dir_s):
+            return index
+        
+        stack = [(self._models_dir_s, '')]
+        while stack:
+            dir_path, rel_prefix = stack.pop()
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    rel_path = rel_prefix + entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append((entry.path, rel_path + '/'))
+                    else:
+                        index.add(rel_path)
+        return index
+    
     def setup_all_dependencies(self) -> Dict[str, Any]:
         """Setup all dependencies (custom nodes + models)."""
         print("Setting up all workflow dependencies...")
@@ -249,25 +559,26 @@ class WorkflowSetupManager:
         deps = self.get_all_dependencies()
         workflows = self.scan_workflows()
         
-        report = f"=== YakComfyUI Dependency Report ===\n"
-        report += f"Available Workflows: {len(workflows)}\n"
-        report += f"Required Custom Nodes: {len(deps['custom_nodes'])}\n"
-        report += f"Required Models: {len(deps['models'])}\n\n"
-        
-        report += "Workflows:\n"
-        for workflow in workflows:
-            report += f"  - {workflow}\n"
+        parts: List[str] = [
+            "=== YakComfyUI Dependency Report ===",
+            f"Available Workflows: {len(workflows)}",
+            f"Required Custom Nodes: {len(deps['custom_nodes'])}",
+            f"Required Models: {len(deps['models'])}",
+            "",
+            "Workflows:",
+        ]
+        parts.extend(f"  - {workflow}" for workflow in workflows)
         
-        report += "\nCustom Nodes:\n"
-        for node in deps['custom_nodes']:
-            report += f"  - {node['name']}\n"
+        parts.append("\nCustom Nodes:")
+        parts.extend(f"  - {node['name']}" for node in deps['custom_nodes'])
         
-        report += "\nModels:\n"
+        parts.append("\nModels:")
         for model in deps['models']:
             size_info = f" ({model.get('install_path', 'unknown path')})"
-            report += f"  - {model['name']}{size_info}\n"
+            parts.append(f"  - {model['name']}{size_info}")
         
-        return report
+        # Joined once, with the trailing newline the += version produced
+        return "\n".join(parts) + "\n"
 
 if __name__ == "__main__":
     manager = WorkflowSetupManager()